@@ -1,5 +1,21 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+
+import faiss
 import streamlit as st
-from openai import OpenAI
+import tiktoken
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 ###############################################################################
 # 1) SETUP
@@ -10,15 +26,39 @@ st.set_page_config(
     layout="centered",
 )
 
-# Create the OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+# Upper bound on OpenAI requests in flight when calls are fanned out
+MAX_CONCURRENT_REQUESTS = 10
+request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+# One event loop per session, reused across reruns
+if "loop" not in st.session_state:
+    st.session_state["loop"] = asyncio.new_event_loop()
 # Ensure these session states exist
 if "scenario_output" not in st.session_state:
     st.session_state["scenario_output"] = None
 if "evaluation_rubric" not in st.session_state:
     st.session_state["evaluation_rubric"] = None
+if "evaluation_criteria" not in st.session_state:
+    st.session_state["evaluation_criteria"] = ()
+if "scenario_usage" not in st.session_state:
+    st.session_state["scenario_usage"] = None
+if "scenario_batch_id" not in st.session_state:
+    # A pending batch is also kept in the URL, so a reload can pick it up again
+    st.session_state["scenario_batch_id"] = st.query_params.get("batch")
+if "scenario_candidates" not in st.session_state:
+    st.session_state["scenario_candidates"] = None
 if "simulation_messages" not in st.session_state:
     st.session_state["simulation_messages"] = []
+if "conversation_text" not in st.session_state:
+    st.session_state["conversation_text"] = ""
+if "history_summary" not in st.session_state:
+    st.session_state["history_summary"] = ""
+if "conversation_tokens" not in st.session_state:
+    st.session_state["conversation_tokens"] = 0
+if "summarized_upto" not in st.session_state:
+    st.session_state["summarized_upto"] = 0
+if "summarized_tokens" not in st.session_state:
+    st.session_state["summarized_tokens"] = 0
 if "evaluation_feedback" not in st.session_state:
     st.session_state["evaluation_feedback"] = None
 if "simulation_finished" not in st.session_state:
@@ -35,26 +75,70 @@ INFLUENCE_DATA = """
 # 3) PROMPT TEMPLATES
 ###############################################################################
 
-SCENARIO_DESIGNER_PROMPT_TEMPLATE = """
+# Static prefix: identical on every call, so OpenAI's automatic prompt caching
+# can reuse it (prefixes of 1024+ tokens qualify once INFLUENCE_DATA is filled in).
+SCENARIO_DESIGNER_SYSTEM_PROMPT_TEMPLATE = """
 You are the Scenario Designer Agent (o3-mini). 
 You have 'reasoning_effort="high"' to produce a thoughtful scenario.
 
+Tasks:
+1. Create a realistic, detailed scenario requiring the user to apply at least two different influence tactics.
+2. Produce a multi-criteria evaluation rubric (scoring or rating) that will be used to judge the user's performance.
+3. List the short name of each rubric criterion, exactly as it appears in the rubric.
+
+Use the following Influence Data to inform your scenario design:
+{influence_data}
+"""
+
+# INFLUENCE_DATA never changes, so substitute it once at import. str.replace
+# (rather than str.format) also tolerates braces inside the data.
+SCENARIO_DESIGNER_SYSTEM_PROMPT = SCENARIO_DESIGNER_SYSTEM_PROMPT_TEMPLATE.replace(
+    "{influence_data}", INFLUENCE_DATA
+)
+
+# Structured output: the API guarantees a JSON object with all three fields
+SCENARIO_DESIGNER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "scenario_out",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "scenario": {"type": "string"},
+                "rubric": {"type": "string"},
+                "criteria": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["scenario", "rubric", "criteria"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Dynamic suffix: only the user's inputs vary between calls.
+SCENARIO_DESIGNER_USER_PROMPT_TEMPLATE = """
 User inputs:
 - Influence tactics to practice: {tactics}
 - User scenario details: {scenario_details}
 - Desired role: {role}
 - Make it up? {make_it_up}
 - Difficulty: {difficulty}
+"""
 
-Use the following Influence Data to inform your scenario design:
-{influence_data}
+# Changes whenever the prompts or output schema do, so cached designs made
+# under an older version are not reused
+SCENARIO_DESIGNER_PROMPT_FINGERPRINT = hashlib.sha256(
+    (
+        SCENARIO_DESIGNER_SYSTEM_PROMPT
+        + SCENARIO_DESIGNER_USER_PROMPT_TEMPLATE
+        + json.dumps(SCENARIO_DESIGNER_RESPONSE_FORMAT, sort_keys=True)
+    ).encode()
+).hexdigest()[:16]
 
-Tasks:
-1. Create a realistic, detailed scenario requiring the user to apply at least two different influence tactics.
-2. Produce a multi-criteria evaluation rubric (scoring or rating) that will be used to judge the user's performance.
-3. Output must contain:
-   - SCENARIO:
-   - EVALUATION_RUBRIC:
+# Appended to each request in a batch, so the variations actually differ
+SCENARIO_DESIGNER_VARIATION_NOTE = """
+This is variation {index} of {total}. Make it clearly different from the other variations
+(setting, stakeholders, and obstacles), while still matching the inputs above.
 """
 
 SIMULATION_FACILITATOR_PROMPT_TEMPLATE = """
@@ -71,7 +155,7 @@ Invite them to respond in paragraphs.
 """
 
 EVALUATOR_PROMPT_TEMPLATE = """
-You are the Evaluator & Feedback Agent (gpt-4.5).
+You are the Evaluator & Feedback Agent.
 
 Scenario:
 {scenario_text}
@@ -82,87 +166,874 @@ User-Facilitator Conversation:
 Evaluation Rubric:
 {evaluation_rubric}
 
-1) Score the user’s performance against the rubric.
-2) Provide detailed feedback (strengths, weaknesses).
-3) Reference relevant influence frameworks in your explanation.
+Criteria to score:
+{criteria}
+
+1) Score the user’s performance on each criterion separately, using the criterion names exactly
+   as listed: give the score and the maximum possible score, and justify it in one or two sentences.
+2) List the user’s strengths and weaknesses, each as a short, specific point.
+3) Name the influence frameworks that apply and how the user did or could have used them.
+4) Summarize the overall performance in two or three sentences.
+"""
+
+# Per-criterion fields keep smaller evaluator models grounded in the rubric
+EVALUATOR_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "evaluation",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "scores": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "criterion": {"type": "string"},
+                            "score": {"type": "integer"},
+                            "max_score": {"type": "integer"},
+                            "justification": {"type": "string"},
+                        },
+                        "required": ["criterion", "score", "max_score", "justification"],
+                        "additionalProperties": False,
+                    },
+                },
+                "strengths": {"type": "array", "items": {"type": "string"}},
+                "weaknesses": {"type": "array", "items": {"type": "string"}},
+                "frameworks": {"type": "array", "items": {"type": "string"}},
+                "summary": {"type": "string"},
+            },
+            "required": ["scores", "strengths", "weaknesses", "frameworks", "summary"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def evaluator_response_format(criteria):
+    """EVALUATOR_RESPONSE_FORMAT with the criterion names pinned, so every sample uses the same keys."""
+    response_format = copy.deepcopy(EVALUATOR_RESPONSE_FORMAT)
+    if criteria:
+        score_schema = response_format["json_schema"]["schema"]["properties"]["scores"]["items"]
+        score_schema["properties"]["criterion"]["enum"] = list(criteria)
+    return response_format
+
+
+EVALUATOR_PROMPT_FINGERPRINT = hashlib.sha256(
+    (EVALUATOR_PROMPT_TEMPLATE + json.dumps(EVALUATOR_RESPONSE_FORMAT, sort_keys=True)).encode()
+).hexdigest()[:16]
+
+HISTORY_SUMMARIZER_PROMPT_TEMPLATE = """
+You keep a running summary of an influence-practice simulation.
+
+Summary so far:
+{summary}
+
+New turns to fold in:
+{new_turns}
+
+Rewrite the summary so it covers everything above in under 200 words.
+Keep the user's key moves, the tactics they used, and how the other characters responded.
 """
 
 ###############################################################################
-# 4) AGENT-CALLING FUNCTIONS
+# 4) RESPONSE CACHE
 ###############################################################################
 
-def call_scenario_designer(tactics, scenario_details, role, make_it_up, difficulty):
-    """Calls the Scenario Designer agent. Returns scenario + rubric text."""
-    prompt = SCENARIO_DESIGNER_PROMPT_TEMPLATE.format(
+@dataclass
+class CacheEntry:
+    response: object
+    created_at: float = field(default_factory=time.time)
+    scope: str = ""
+    ttl_seconds: float = None
+
+    def expired(self, now):
+        return self.ttl_seconds is not None and now - self.created_at >= self.ttl_seconds
+
+
+def normalize(text):
+    """Canonical form of free text for cache keys: lowercase, no punctuation, single spaces."""
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+def normalize_tactics(tactics):
+    """Order-insensitive tactics list, so "Rational, Consult" and "consult;rational" match."""
+    return ",".join(sorted(t for t in (normalize(t) for t in re.split(r"[,;]", tactics)) if t))
+
+
+# USD per 1M tokens (input, output), used to estimate what cache hits saved
+MODEL_PRICES = {
+    "o3-mini": (1.10, 4.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def estimate_cost(response):
+    """Approximate USD cost of a completion from its usage; 0 for unknown models."""
+    matches = [m for m in MODEL_PRICES if response.model.startswith(m)]
+    if not matches or response.usage is None:
+        return 0.0
+    input_price, output_price = MODEL_PRICES[max(matches, key=len)]
+    usage = response.usage
+    return (usage.prompt_tokens * input_price + usage.completion_tokens * output_price) / 1_000_000
+
+
+LLM_CACHE_PATH = ".llm_cache.sqlite3"
+
+# How long cached completions stay valid, per kind of request
+SCENARIO_CACHE_TTL = 30 * 24 * 3600
+EVALUATION_CACHE_TTL = 7 * 24 * 3600
+
+
+class LLMCache:
+    """
+    Exact-match cache of chat completions, keyed by a hash of the request and
+    stored in SQLite so hits survive restarts and redeploys.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_seconds=3600, max_temperature=0.3):
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_usd = 0.0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at INTEGER, hit_count INTEGER)"
+            )
+
+    @staticmethod
+    def _hash_request(model, content, temperature):
+        payload = {"model": model, "messages": content, "temperature": temperature}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def get_or_call(self, model, messages, temperature, call, ttl_seconds=None, key_fields=None):
+        """Returns the cached response for this request, or awaits call() and stores it.
+        If key_fields is given, it is hashed in place of the messages (e.g. normalized
+        user inputs). Requests sampled above max_temperature always go to the API."""
+        if temperature is not None and temperature > self.max_temperature:
+            return await call()
+
+        key = self._hash_request(model, messages if key_fields is None else key_fields, temperature)
+        ttl = ttl_seconds or self.ttl_seconds
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and time.time() - row[1] < ttl:
+            response = ChatCompletion.model_validate_json(row[0])
+            with self.lock, self.conn:
+                self.conn.execute("UPDATE cache SET hit_count = hit_count + 1 WHERE key = ?", (key,))
+            self.hits += 1
+            self.saved_usd += estimate_cost(response)
+            return response
+
+        self.misses += 1
+        response = await call()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, 0)",
+                (key, model, response.model_dump_json(), int(time.time()))
+            )
+        return response
+
+
+@st.cache_resource
+def get_llm_cache():
+    """One response cache per process, shared across sessions and reruns."""
+    return LLMCache()
+
+
+SEMANTIC_CACHE_DIR = ".semantic_cache"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+
+class SemanticCache:
+    """
+    Near-duplicate cache: prompts are embedded with MiniLM and matched by cosine
+    similarity, so paraphrased inputs reuse an earlier completion. Entries only
+    match within the same scope (model plus any inputs that must agree exactly).
+    The embedder is only loaded on the first lookup, so reading the hit
+    counters (e.g. for the sidebar) stays cheap.
+    """
+
+    def __init__(self, load_embedder, path=SEMANTIC_CACHE_DIR, threshold=0.95, search_k=8):
+        self.load_embedder = load_embedder
+        self.path = path
+        self.threshold = threshold
+        self.search_k = search_k
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_usd = 0.0
+
+        self.index_file = os.path.join(path, "index.faiss")
+        self.entries_file = os.path.join(path, "entries.json")
+        self.index, self.entries = self.load()
+
+    def load(self):
+        """
+        Reads the index and entries from disk. A missing, unreadable or
+        inconsistent cache (e.g. index and entries out of step) starts empty
+        rather than breaking the app.
+        """
+        empty = faiss.IndexFlatIP(EMBEDDING_DIM), []
+        if not (os.path.exists(self.index_file) and os.path.exists(self.entries_file)):
+            return empty
+        try:
+            index = faiss.read_index(self.index_file)
+            with open(self.entries_file, encoding="utf-8") as f:
+                entries = [
+                    CacheEntry(
+                        ChatCompletion.model_validate(e["response"]), e["created_at"], e["scope"], e.get("ttl_seconds")
+                    )
+                    for e in json.load(f)
+                ]
+        except (OSError, RuntimeError, ValueError, KeyError, TypeError):
+            return empty
+        if index.d != EMBEDDING_DIM or index.ntotal != len(entries):
+            return empty
+        return index, entries
+
+    @property
+    def embedder(self):
+        return self.load_embedder()
+
+    def fits(self, prompt_text):
+        """False if the prompt is longer than the embedder sees (it would be truncated)."""
+        return len(self.embedder.tokenizer.tokenize(prompt_text)) <= self.embedder.max_seq_length
+
+    def embed(self, prompt_text):
+        # L2-normalized, so inner product == cosine similarity
+        return self.embedder.encode([prompt_text], normalize_embeddings=True).astype("float32")
+
+    def lookup(self, vec, scope):
+        now = time.time()
+        with self.lock:
+            if self.index.ntotal == 0:
+                return None
+            scores, ids = self.index.search(vec, min(self.search_k, self.index.ntotal))
+            for score, idx in zip(scores[0], ids[0]):
+                if score < self.threshold:
+                    break
+                entry = self.entries[idx]
+                if entry.scope == scope and not entry.expired(now):
+                    return entry.response
+        return None
+
+    def semantic_lookup(self, prompt_text, scope):
+        """Returns the stored completion for a similar prompt in this scope, or None."""
+        return self.lookup(self.embed(prompt_text), scope)
+
+    def add(self, vec, scope, response, ttl_seconds=None):
+        with self.lock:
+            self.index.add(vec)
+            # Age from when the completion was generated, which may predate this
+            # entry if it came out of the SQLite layer
+            self.entries.append(CacheEntry(response, response.created, scope, ttl_seconds))
+            self.prune()
+            self.save()
+
+    def prune(self):
+        """Drops expired entries, rebuilding the index from the vectors that remain."""
+        now = time.time()
+        keep = [i for i, e in enumerate(self.entries) if not e.expired(now)]
+        if len(keep) == len(self.entries):
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        self.index = faiss.IndexFlatIP(EMBEDDING_DIM)
+        if keep:
+            self.index.add(vectors[keep])
+        self.entries = [self.entries[i] for i in keep]
+
+    def save(self):
+        # Write to temp files and swap them in, so a crash mid-write never
+        # leaves a truncated file behind (load() rejects a half-swapped pair)
+        os.makedirs(self.path, exist_ok=True)
+        index_tmp, entries_tmp = self.index_file + ".tmp", self.entries_file + ".tmp"
+        faiss.write_index(self.index, index_tmp)
+        with open(entries_tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                [
+                    {
+                        "response": e.response.model_dump(mode="json"),
+                        "created_at": e.created_at,
+                        "scope": e.scope,
+                        "ttl_seconds": e.ttl_seconds,
+                    }
+                    for e in self.entries
+                ],
+                f,
+            )
+        os.replace(index_tmp, self.index_file)
+        os.replace(entries_tmp, self.entries_file)
+
+    async def get_or_call(self, prompt_text, scope, call, ttl_seconds=None):
+        """Returns a completion cached for a similar prompt, or awaits call() and stores it.
+        Entries older than ttl_seconds (if given) are ignored and pruned on the next save."""
+        if not self.fits(prompt_text):
+            return await call()
+
+        vec = self.embed(prompt_text)
+        response = self.lookup(vec, scope)
+        if response is not None:
+            self.hits += 1
+            self.saved_usd += estimate_cost(response)
+            return response
+
+        self.misses += 1
+        response = await call()
+        self.add(vec, scope, response, ttl_seconds)
+        return response
+
+
+@st.cache_resource
+def get_embedder():
+    """Loads the sentence embedding model once per process."""
+    # Imported here so torch is only loaded once a lookup actually needs it
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+@st.cache_resource
+def get_semantic_cache():
+    """One semantic cache per process, loaded from disk if present."""
+    return SemanticCache(get_embedder)
+
+###############################################################################
+# 5) AGENT-CALLING FUNCTIONS
+###############################################################################
+
+def run_async(coro):
+    """Runs a coroutine to completion on this session's event loop."""
+    return st.session_state["loop"].run_until_complete(coro)
+
+
+def get_async_client():
+    """
+    Returns this session's AsyncOpenAI client, creating it on first use.
+    Its httpx connection pool is bound to the event loop that opened it, so the
+    client lives next to the session's loop instead of in st.cache_resource;
+    either way it persists across reruns and keeps its connections alive.
+    Retries are handled by tenacity below, not by the SDK.
+    """
+    if "aclient" not in st.session_state:
+        st.session_state["aclient"] = AsyncOpenAI(api_key=st.secrets["OPENAI_API_KEY"], max_retries=0)
+    return st.session_state["aclient"]
+
+
+def get_evaluator_client():
+    """
+    Client for the evaluator. Defaults to the OpenAI client; setting
+    EVALUATOR_BASE_URL in secrets points it at any OpenAI-compatible server
+    instead, e.g. Ollama at http://localhost:11434/v1 together with
+    EVALUATOR_MODEL = "llama3.1:8b-instruct-q4_K_M".
+    """
+    base_url = st.secrets.get("EVALUATOR_BASE_URL")
+    if not base_url:
+        return get_async_client()
+    if "evaluator_client" not in st.session_state:
+        st.session_state["evaluator_client"] = AsyncOpenAI(
+            base_url=base_url,
+            api_key=st.secrets.get("EVALUATOR_API_KEY", "ollama"),
+            max_retries=0
+        )
+    return st.session_state["evaluator_client"]
+
+
+def is_retryable_error(exc):
+    """True for rate limits (429), server errors (5xx) and dropped connections."""
+    if isinstance(exc, APIConnectionError):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+@retry(
+    retry=retry_if_exception(is_retryable_error),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+async def create_chat_completion(client=None, **kwargs):
+    """Sends one chat completion request, bounded by the shared semaphore."""
+    client = client or get_async_client()
+    async with request_semaphore:
+        return await client.chat.completions.create(**kwargs)
+
+
+def build_scenario_designer_request(tactics, scenario_details, role, make_it_up, difficulty, variation=None):
+    """Chat completion arguments for one Scenario Designer call. `variation` is (index, total) in a batch."""
+    prompt = SCENARIO_DESIGNER_USER_PROMPT_TEMPLATE.format(
         tactics=tactics,
         scenario_details=scenario_details,
         role=role,
         make_it_up=make_it_up,
-        difficulty=difficulty,
-        influence_data=INFLUENCE_DATA
+        difficulty=difficulty
     )
-    response = client.chat.completions.create(
-        model="o3-mini",
-        reasoning_effort="high",
-        messages=[
-            {"role": "system", "content": "You are a helpful scenario designer."},
+    if variation is not None:
+        index, total = variation
+        prompt += SCENARIO_DESIGNER_VARIATION_NOTE.format(index=index, total=total)
+    return {
+        "model": "o3-mini",
+        "reasoning_effort": "high",
+        "messages": [
+            {"role": "system", "content": SCENARIO_DESIGNER_SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
-        ]
-    )
-    text_out = response.choices[0].message.content
-
-    # Parse SCENARIO: and EVALUATION_RUBRIC:
-    scenario_part, rubric_part = "", ""
-    if "EVALUATION_RUBRIC:" in text_out:
-        parts = text_out.split("EVALUATION_RUBRIC:")
-        scenario_part = parts[0].replace("SCENARIO:", "").strip()
-        rubric_part = parts[1].strip()
+        ],
+        "response_format": SCENARIO_DESIGNER_RESPONSE_FORMAT,
+    }
+
+
+def check_completion(response, agent):
+    """
+    Returns the reply message if the model answered in full. Raises ValueError
+    on a refusal or a reply cut short (length limit, content filter), so that
+    neither is ever cached.
+    """
+    choice = response.choices[0]
+    if choice.message.refusal:
+        raise ValueError(f"The {agent} declined: {choice.message.refusal}")
+    if choice.finish_reason != "stop":
+        raise ValueError(f"The {agent} reply was cut short ({choice.finish_reason}).")
+    return choice.message
+
+
+def parse_scenario_designer_message(message):
+    """Returns (scenario, rubric, criterion names) from a Scenario Designer reply."""
+    if message.refusal:
+        return message.refusal, "No rubric found.", ()
+    result = json.loads(message.content)
+    criteria = tuple(dict.fromkeys(c.strip() for c in result["criteria"] if c.strip()))
+    return result["scenario"].strip(), result["rubric"].strip(), criteria
+
+
+async def call_scenario_designer(tactics, scenario_details, role, make_it_up, difficulty):
+    """
+    Calls the Scenario Designer agent. Returns scenario + rubric text and the
+    rubric's criterion names; raises ValueError if no usable scenario came back.
+    The token usage of a live API call is stored in st.session_state["scenario_usage"];
+    answers served from a cache leave it untouched, since no call was made.
+    """
+    request = build_scenario_designer_request(tactics, scenario_details, role, make_it_up, difficulty)
+
+    async def call_api():
+        response = await create_chat_completion(**request)
+        message = check_completion(response, "Scenario Designer")
+        try:
+            parse_scenario_designer_message(message)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError("The Scenario Designer returned a malformed scenario.") from e
+        st.session_state["scenario_usage"] = response.usage
+        return response
+
+    # Cache on the normalized inputs rather than the formatted prompt, which is
+    # mostly the unchanging INFLUENCE_DATA prefix (tracked by the fingerprint)
+    tactics, scenario_details, role = normalize_tactics(tactics), normalize(scenario_details), normalize(role)
+    difficulty = int(difficulty)
+    # Only the scenario description is matched semantically; tactics and role
+    # change what gets practised, so they must agree exactly like the rest
+    key_fields = [SCENARIO_DESIGNER_PROMPT_FINGERPRINT, tactics, scenario_details, role, make_it_up, difficulty]
+    scope = "|".join([
+        "o3-mini", SCENARIO_DESIGNER_PROMPT_FINGERPRINT, f"tactics={tactics}", f"role={role}",
+        f"make_it_up={make_it_up}", f"difficulty={difficulty}",
+    ])
+
+    def call_exact():
+        return get_llm_cache().get_or_call(
+            "o3-mini", request["messages"], None,
+            call_api,
+            ttl_seconds=SCENARIO_CACHE_TTL,
+            key_fields=key_fields
+        )
+
+    # A blank description has nothing to paraphrase; the exact-match layer covers it
+    if scenario_details:
+        response = await get_semantic_cache().get_or_call(
+            scenario_details, scope, call_exact, ttl_seconds=SCENARIO_CACHE_TTL
+        )
     else:
-        scenario_part = text_out.strip()
-        rubric_part = "No rubric found."
-    return scenario_part, rubric_part
+        response = await call_exact()
+    return parse_scenario_designer_message(response.choices[0].message)
+
+
+async def submit_scenario_designer_batch(list_of_param_dicts):
+    """
+    Queues one Scenario Designer request per param dict on the OpenAI Batch API
+    (about half the real-time price, completed within 24h). Returns the batch id.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": f"scenario-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_scenario_designer_request(**params, variation=(i + 1, len(list_of_param_dicts))),
+        })
+        for i, params in enumerate(list_of_param_dicts)
+    ]
+    client = get_async_client()
+    input_file = await client.files.create(
+        file=("scenario_requests.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return batch.id
+
 
+async def fetch_scenario_designer_batch(batch_id):
+    """
+    Returns [(scenario, rubric, criteria), ...] for the variations that succeeded, in
+    submission order, once the batch has completed (empty if none did), or None
+    while it is still running. Raises RuntimeError if the batch failed, expired
+    or was cancelled.
+    """
+    client = get_async_client()
+    batch = await client.batches.retrieve(batch_id)
+    if batch.status in ("failed", "expired", "cancelled"):
+        raise RuntimeError(f"Scenario batch {batch_id} {batch.status}.")
+    if batch.status != "completed":
+        return None
 
-def call_simulation_facilitator(scenario_text, conversation_text):
-    """Calls the Simulation Facilitator (gpt-4o) to get next scenario step."""
+    results = {}
+    if batch.output_file_id:
+        output = await client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            message = ChatCompletion.model_validate(response["body"]).choices[0].message
+            # A refusal is not a playable scenario
+            if message.refusal:
+                continue
+            index = int(record["custom_id"].rsplit("-", 1)[1])
+            results[index] = parse_scenario_designer_message(message)
+    return [results[i] for i in sorted(results)]
+
+
+async def call_simulation_facilitator(scenario_text, conversation_text):
+    """Calls the Simulation Facilitator (gpt-4o) to get next scenario step. Returns a token stream."""
     prompt = SIMULATION_FACILITATOR_PROMPT_TEMPLATE.format(
         scenario_text=scenario_text,
         conversation_history=conversation_text
     )
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are the simulation facilitator."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.7
-    )
-    return response.choices[0].message.content
+    messages = [
+        {"role": "system", "content": "You are the simulation facilitator."},
+        {"role": "user", "content": prompt},
+    ]
+    return await create_chat_completion(model="gpt-4o", messages=messages, temperature=0.7, stream=True)
+
+
+def iter_stream_text(stream):
+    """Yields the text deltas of an async completion stream, driven on this session's loop."""
+    loop = st.session_state["loop"]
+    while True:
+        try:
+            chunk = loop.run_until_complete(stream.__anext__())
+        except StopAsyncIteration:
+            return
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
 
 
-def call_evaluator(scenario_text, conversation_text, rubric_text):
-    """Calls the Evaluator & Feedback agent (gpt-4.5)."""
+def build_evaluator_messages(scenario_text, conversation_text, rubric_text, criteria):
     prompt = EVALUATOR_PROMPT_TEMPLATE.format(
         scenario_text=scenario_text,
         conversation_history=conversation_text,
-        evaluation_rubric=rubric_text
+        evaluation_rubric=rubric_text,
+        criteria="\n".join(f"- {c}" for c in criteria) or "(take them from the rubric)"
+    )
+    return [
+        {"role": "system", "content": "You are the evaluator."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def parse_evaluation_message(message):
+    """Returns the evaluation dict from an Evaluator reply."""
+    if message.refusal:
+        return {
+            "scores": [], "strengths": [], "weaknesses": [], "frameworks": [],
+            "summary": message.refusal, "refused": True,
+        }
+    return json.loads(message.content)
+
+
+async def call_evaluator(scenario_text, conversation_text, rubric_text, criteria=()):
+    """
+    Calls the Evaluator & Feedback agent (gpt-4o-mini by default). Returns the
+    evaluation dict; raises ValueError if no usable evaluation came back.
+    """
+    model = st.secrets.get("EVALUATOR_MODEL", "gpt-4o-mini")
+    messages = build_evaluator_messages(scenario_text, conversation_text, rubric_text, criteria)
+
+    async def call_api():
+        # Scoring should be repeatable, so keep the temperature low enough to cache
+        response = await create_chat_completion(
+            client=get_evaluator_client(),
+            model=model,
+            messages=messages,
+            temperature=0.2,
+            response_format=evaluator_response_format(criteria)
+        )
+        message = check_completion(response, "Evaluator")
+        try:
+            evaluation = parse_evaluation_message(message)
+        except ValueError as e:
+            raise ValueError("The Evaluator returned a malformed evaluation.") from e
+        if not isinstance(evaluation, dict) or not isinstance(evaluation.get("scores"), list):
+            raise ValueError("The Evaluator returned a malformed evaluation.")
+        return response
+
+    # Exact matches only: a transcript that merely reads alike may deserve a
+    # different score, so the evaluator never uses the semantic cache
+    response = await get_llm_cache().get_or_call(
+        model, messages, 0.2,
+        call_api,
+        ttl_seconds=EVALUATION_CACHE_TTL,
+        # The response schema pins the criteria, so it is part of the request
+        key_fields=[EVALUATOR_PROMPT_FINGERPRINT, messages, list(criteria)]
     )
-    response = client.chat.completions.create(
-        model="gpt-4o",
+    return parse_evaluation_message(response.choices[0].message)
+
+
+async def call_evaluator_n(scenario_text, conversation_text, rubric_text, criteria=(), n=5):
+    """
+    Self-consistency evaluation: samples the evaluator n times concurrently at
+    temperature 0.7 and aggregates the results. The requests overlap (bounded
+    by the shared semaphore), so this takes about as long as a single call.
+    Samples that fail, are refused or cannot be parsed are left out; raises
+    ValueError only if none are usable.
+    """
+    model = st.secrets.get("EVALUATOR_MODEL", "gpt-4o-mini")
+    messages = build_evaluator_messages(scenario_text, conversation_text, rubric_text, criteria)
+    response_format = evaluator_response_format(criteria)
+
+    async def sample():
+        response = await create_chat_completion(
+            client=get_evaluator_client(),
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            response_format=response_format
+        )
+        evaluation = parse_evaluation_message(check_completion(response, "Evaluator"))
+        if not isinstance(evaluation, dict) or not isinstance(evaluation.get("scores"), list):
+            raise ValueError("The Evaluator returned a malformed evaluation.")
+        return evaluation
+
+    results = await asyncio.gather(*[sample() for _ in range(n)], return_exceptions=True)
+    evaluations = [r for r in results if isinstance(r, dict)]
+    if not evaluations:
+        raise ValueError("None of the evaluator samples could be used.") from results[0]
+    return aggregate_evaluations(evaluations)
+
+
+def dedupe(items):
+    """Drops repeated points (ignoring case and surrounding whitespace), keeping the first wording."""
+    seen = set()
+    unique = []
+    for item in items:
+        key = item.strip().lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append(item.strip())
+    return unique
+
+
+def aggregate_evaluations(evaluations):
+    """
+    Merges several evaluation samples: median score per criterion (with the
+    justification of the sample closest to it), merged and de-duplicated
+    strengths, weaknesses and frameworks, and the summary of the sample whose
+    total score is closest to the median total.
+    """
+    by_criterion = {}
+    for evaluation in evaluations:
+        for s in evaluation["scores"]:
+            by_criterion.setdefault(s["criterion"], []).append(s)
+
+    scores = []
+    for samples in by_criterion.values():
+        median = statistics.median(s["score"] for s in samples)
+        closest = min(samples, key=lambda s: abs(s["score"] - median))
+        scores.append({
+            "criterion": closest["criterion"],
+            "score": median,
+            "max_score": statistics.mode(s["max_score"] for s in samples),
+            "justification": closest["justification"],
+        })
+
+    totals = [sum(s["score"] for s in e["scores"]) for e in evaluations]
+    median_total = statistics.median(totals)
+    representative = evaluations[min(range(len(evaluations)), key=lambda i: abs(totals[i] - median_total))]
+
+    return {
+        "scores": scores,
+        "strengths": dedupe(item for e in evaluations for item in e["strengths"]),
+        "weaknesses": dedupe(item for e in evaluations for item in e["weaknesses"]),
+        "frameworks": dedupe(item for e in evaluations for item in e["frameworks"]),
+        "summary": representative["summary"],
+    }
+
+
+async def call_history_summarizer(summary, new_turns):
+    """Folds turns trimmed from the history into the running summary (gpt-4o-mini)."""
+    prompt = HISTORY_SUMMARIZER_PROMPT_TEMPLATE.format(
+        summary=summary or "(none yet)",
+        new_turns=new_turns
+    )
+    response = await create_chat_completion(
+        model="gpt-4o-mini",
         messages=[
-            {"role": "system", "content": "You are the evaluator."},
+            {"role": "system", "content": "You summarize conversations."},
             {"role": "user", "content": prompt},
         ],
-        temperature=0.7
+        temperature=0.2
     )
     return response.choices[0].message.content
 
 ###############################################################################
-# 5) MAIN STREAMLIT APP
+# 6) CONVERSATION HISTORY
+###############################################################################
+
+# Token budget for the conversation history sent to the facilitator and evaluator
+HISTORY_TOKEN_BUDGET = 6000
+
+
+@st.cache_resource
+def get_encoding():
+    """Loads the gpt-4o tokenizer once per process."""
+    return tiktoken.encoding_for_model("gpt-4o")
+
+
+def format_turn(msg):
+    role_label = "USER" if msg["role"] == "user" else "FACILITATOR"
+    return f"{role_label}: {msg['content']}\n"
+
+
+def append_message(role, content):
+    """
+    Records a turn in the message list and the pre-joined transcript. Each
+    message keeps its token count and its offset into the transcript, so
+    trim_history() never has to walk or re-join earlier messages.
+    """
+    msg = {"role": role, "content": content}
+    line = format_turn(msg)
+    # encode_ordinary: user text like "<|endoftext|>" is counted, not rejected
+    msg["tokens"] = len(get_encoding().encode_ordinary(line))
+    msg["offset"] = len(st.session_state["conversation_text"])
+    st.session_state["simulation_messages"].append(msg)
+    st.session_state["conversation_text"] += line
+    st.session_state["conversation_tokens"] += msg["tokens"]
+
+
+def trim_history(max_tokens=HISTORY_TOKEN_BUDGET):
+    """
+    Transcript that fits in max_tokens: the full buffer while it fits, otherwise
+    the running summary plus the most recent turns. When the unsummarized tail
+    outgrows the budget, the oldest user/facilitator pairs are dropped until it
+    is under half the budget and folded into history_summary, so the summary is
+    only regenerated once the tail has grown past the budget again.
+    """
+    messages = st.session_state["simulation_messages"]
+    text = st.session_state["conversation_text"]
+    start = st.session_state["summarized_upto"]
+    tail_tokens = st.session_state["conversation_tokens"] - st.session_state["summarized_tokens"]
+    if start == 0 and tail_tokens <= max_tokens:
+        return text
+
+    if tail_tokens > max_tokens:
+        cutoff = start
+        # Always keep the latest message verbatim
+        while tail_tokens > max_tokens // 2 and cutoff + 2 < len(messages):
+            tail_tokens -= messages[cutoff]["tokens"] + messages[cutoff + 1]["tokens"]
+            cutoff += 2
+        # Nothing to fold if the latest turns alone are over budget
+        if cutoff > start:
+            new_turns = text[messages[start]["offset"]:messages[cutoff]["offset"]]
+            st.session_state["history_summary"] = run_async(
+                call_history_summarizer(st.session_state["history_summary"], new_turns)
+            )
+            st.session_state["summarized_tokens"] = st.session_state["conversation_tokens"] - tail_tokens
+            st.session_state["summarized_upto"] = start = cutoff
+
+    if start == 0:
+        return text
+    recent = text[messages[start]["offset"]:]
+    return f"SUMMARY OF EARLIER TURNS: {st.session_state['history_summary']}\n{recent}"
+
+###############################################################################
+# 7) CACHED ENTRY POINTS
+###############################################################################
+
+# Streamlit reruns the whole script on every widget interaction. These cached
+# entry points make sure an identical call is never billed twice; only the
+# (hashable) arguments form the cache key.
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def run_scenario_designer(tactics, scenario_details, role, make_it_up, difficulty):
+    return run_async(call_scenario_designer(tactics, scenario_details, role, make_it_up, difficulty))
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def run_evaluator(scenario_text, conversation_text, rubric_text, criteria):
+    return run_async(call_evaluator(scenario_text, conversation_text, rubric_text, criteria))
+
+###############################################################################
+# 8) MAIN STREAMLIT APP
 ###############################################################################
 
+def render_evaluation(evaluation):
+    """Shows the evaluator's per-criterion scores and feedback."""
+    st.write(evaluation["summary"])
+    if evaluation["scores"]:
+        st.table([
+            {
+                "Criterion": s["criterion"],
+                "Score": f"{s['score']}/{s['max_score']}",
+                "Justification": s["justification"],
+            }
+            for s in evaluation["scores"]
+        ])
+    for heading, key in [("Strengths", "strengths"), ("Weaknesses", "weaknesses"), ("Influence Frameworks", "frameworks")]:
+        if evaluation[key]:
+            st.markdown(f"#### {heading}")
+            st.markdown("\n".join(f"- {item}" for item in evaluation[key]))
+
+
+def render_cache_stats():
+    """Sidebar summary of how many paid calls the response caches have avoided."""
+    llm_cache, semantic_cache = get_llm_cache(), get_semantic_cache()
+    lookups = llm_cache.hits + llm_cache.misses
+    st.sidebar.markdown("### Response Cache")
+    st.sidebar.metric("Exact-match hit rate", f"{llm_cache.hits / lookups:.0%}" if lookups else "n/a")
+    st.sidebar.metric("Semantic hits", semantic_cache.hits)
+    st.sidebar.metric("Estimated savings", f"${llm_cache.saved_usd + semantic_cache.saved_usd:.4f}")
+    st.sidebar.caption("Since this server process started.")
+
+
+def set_scenario_batch(batch_id):
+    """Tracks the pending scenario batch (None when there is none) in the session and the page URL."""
+    st.session_state["scenario_batch_id"] = batch_id
+    st.session_state["scenario_candidates"] = None
+    if batch_id:
+        st.query_params["batch"] = batch_id
+    else:
+        st.query_params.pop("batch", None)
+
+
 def main():
     st.title("AI-Powered Influence Simulation")
+    render_cache_stats()
 
     ###########################################################################
     # (A) SCENARIO SETUP -- only shown if no scenario is yet generated
@@ -174,18 +1045,76 @@ def main():
         user_role = st.text_input("What role do you want to play?")
         user_make_up = st.radio("Should the AI just make something up?", ["Yes", "No"])
         user_difficulty = st.slider("How challenging do you want it?", 1, 5, 3)
+        use_batch = st.checkbox("Use low-cost batch mode (up to 24h)")
+        if use_batch:
+            num_variations = st.number_input("How many scenario variations?", 1, 10, 3)
+            resume_id = st.text_input("Or resume an earlier batch (paste its id):").strip()
+            if resume_id and st.button("Resume batch"):
+                set_scenario_batch(resume_id)
 
         if st.button("Generate Scenario"):
-            scenario_text, rubric_text = call_scenario_designer(
+            params = dict(
                 tactics=user_tactics,
                 scenario_details=user_scenario,
                 role=user_role,
                 make_it_up=user_make_up,
                 difficulty=user_difficulty
             )
-            st.session_state["scenario_output"] = scenario_text
-            st.session_state["evaluation_rubric"] = rubric_text
-            st.success("Scenario Generated! Please scroll down to continue.")
+            if use_batch:
+                set_scenario_batch(run_async(submit_scenario_designer_batch([params] * int(num_variations))))
+                st.success("Batch submitted! Come back and check its status below.")
+            else:
+                # Only set again if the designer really calls the API (not on a cache hit)
+                st.session_state["scenario_usage"] = None
+                try:
+                    scenario_text, rubric_text, criteria = run_scenario_designer(**params)
+                except ValueError as e:
+                    st.error(f"{e} Please try again.")
+                else:
+                    st.session_state["scenario_output"] = scenario_text
+                    st.session_state["evaluation_rubric"] = rubric_text
+                    st.session_state["evaluation_criteria"] = criteria
+                    st.success("Scenario Generated! Please scroll down to continue.")
+
+        # Batch mode: poll on demand, then let the user pick a variation
+        if st.session_state["scenario_batch_id"] and st.session_state["scenario_candidates"] is None:
+            st.caption(
+                f"Pending batch: `{st.session_state['scenario_batch_id']}`. "
+                "Keep this page's link or note the id to resume it later."
+            )
+            if st.button("Check batch status"):
+                try:
+                    candidates = run_async(fetch_scenario_designer_batch(st.session_state["scenario_batch_id"]))
+                except RuntimeError as e:
+                    set_scenario_batch(None)
+                    st.error(str(e))
+                else:
+                    if candidates is None:
+                        st.info("Your scenarios are still being generated. Check back later.")
+                    elif not candidates:
+                        set_scenario_batch(None)
+                        st.error("None of the scenario variations could be generated. Please try again.")
+                    else:
+                        st.session_state["scenario_candidates"] = candidates
+
+        if st.session_state["scenario_candidates"]:
+            candidates = st.session_state["scenario_candidates"]
+            for i, (candidate_scenario, _, _) in enumerate(candidates):
+                with st.expander(f"Scenario {i + 1}"):
+                    st.write(candidate_scenario)
+            choice = st.radio(
+                "Which scenario do you want to play?",
+                range(len(candidates)),
+                format_func=lambda i: f"Scenario {i + 1}"
+            )
+            if st.button("Use this scenario"):
+                scenario_text, rubric_text, criteria = candidates[choice]
+                st.session_state["scenario_output"] = scenario_text
+                st.session_state["evaluation_rubric"] = rubric_text
+                st.session_state["evaluation_criteria"] = criteria
+                st.session_state["scenario_usage"] = None
+                set_scenario_batch(None)
+                st.success("Scenario selected! Please scroll down to continue.")
 
     ###########################################################################
     # (B) SHOW SCENARIO + SIMULATION UI (Chat Bot) if we have scenario
@@ -196,46 +1125,37 @@ def main():
         st.markdown("#### Scenario Context:")
         st.write(scenario_text)
 
+        usage = st.session_state["scenario_usage"]
+        if usage is not None:
+            details = usage.prompt_tokens_details
+            cached_tokens = (details.cached_tokens or 0) if details else 0
+            st.caption(
+                f"Prompt cache: {cached_tokens} of {usage.prompt_tokens} input tokens "
+                "were served from OpenAI's prefix cache."
+            )
+
         st.markdown("---")
         st.markdown("### Simulation Conversation")
 
         # Show conversation so far
         for msg in st.session_state["simulation_messages"]:
-            if msg["role"] == "user":
-                st.markdown(f"**You:** {msg['content']}")
-            else:
-                st.markdown(f"**Simulation Facilitator:** {msg['content']}")
+            with st.chat_message(msg["role"]):
+                st.markdown(msg["content"])
 
-        st.markdown("---")
-        user_input = st.text_area("Your next move (paragraph or more):")
+        if user_input := st.chat_input("Your next move (paragraph or more)"):
+            append_message("user", user_input)
+            with st.chat_message("user"):
+                st.markdown(user_input)
 
-        col1, col2 = st.columns([1, 1])
-        with col1:
-            if st.button("Submit Move"):
-                if not user_input.strip():
-                    st.warning("Please enter a move.")
-                else:
-                    # Append user's message
-                    st.session_state["simulation_messages"].append(
-                        {"role": "user", "content": user_input}
-                    )
-                    # Build conversation text
-                    conversation_text = ""
-                    for m in st.session_state["simulation_messages"]:
-                        role_label = "USER" if m["role"] == "user" else "FACILITATOR"
-                        conversation_text += f"{role_label}: {m['content']}\n"
-
-                    # Call the facilitator
-                    facilitator_output = call_simulation_facilitator(scenario_text, conversation_text)
-                    st.session_state["simulation_messages"].append(
-                        {"role": "assistant", "content": facilitator_output}
-                    )
-                    st.success("Move submitted! Scroll down to see the facilitator's response.")
+            # Call the facilitator and render its reply as it streams in
+            with st.chat_message("assistant"):
+                stream = run_async(call_simulation_facilitator(scenario_text, trim_history()))
+                facilitator_output = st.write_stream(iter_stream_text(stream))
+            append_message("assistant", facilitator_output)
 
-        with col2:
-            if st.button("Finish & Evaluate"):
-                st.session_state["simulation_finished"] = True
-                st.success("You've chosen to finish. Scroll to Step 3 for evaluation.")
+        if st.button("Finish & Evaluate"):
+            st.session_state["simulation_finished"] = True
+            st.success("You've chosen to finish. Scroll to Step 3 for evaluation.")
 
     ###########################################################################
     # (C) EVALUATION UI if user finishes simulation
@@ -244,39 +1164,55 @@ def main():
         st.header("Step 3: Evaluation & Feedback")
         # If we haven't evaluated yet, do so
         if st.session_state["evaluation_feedback"] is None:
-            st.info("Evaluating your entire conversation... please wait.")
-
-            # Build conversation text
-            conversation_text = ""
-            for m in st.session_state["simulation_messages"]:
-                role_label = "USER" if m["role"] == "user" else "FACILITATOR"
-                conversation_text += f"{role_label}: {m['content']}\n"
-
-            # Call evaluator
-            feedback = call_evaluator(
-                st.session_state["scenario_output"],
-                conversation_text,
-                st.session_state["evaluation_rubric"]
+            high_confidence = st.checkbox(
+                "High-confidence evaluation (combines 5 evaluator samples)",
+                help="Costs five evaluator calls, but they run concurrently, so it takes about as long as one."
             )
-            st.session_state["evaluation_feedback"] = feedback
-            st.success("Evaluation complete! See below for detailed feedback.")
+            if st.button("Evaluate"):
+                st.info("Evaluating your entire conversation... please wait.")
+
+                # Call evaluator on the transcript, trimmed to the token budget
+                args = (
+                    st.session_state["scenario_output"],
+                    trim_history(),
+                    st.session_state["evaluation_rubric"],
+                    st.session_state["evaluation_criteria"]
+                )
+                try:
+                    if high_confidence:
+                        feedback = run_async(call_evaluator_n(*args))
+                    else:
+                        feedback = run_evaluator(*args)
+                except ValueError as e:
+                    st.error(f"{e} Please try again.")
+                else:
+                    st.session_state["evaluation_feedback"] = feedback
+                    st.success("Evaluation complete! See below for detailed feedback.")
 
         # Show feedback
         if st.session_state["evaluation_feedback"]:
             st.markdown("### Evaluation Results")
-            st.write(st.session_state["evaluation_feedback"])
+            render_evaluation(st.session_state["evaluation_feedback"])
 
         # Restart button
         if st.button("Restart Everything"):
             st.session_state["scenario_output"] = None
             st.session_state["evaluation_rubric"] = None
+            st.session_state["evaluation_criteria"] = ()
+            st.session_state["scenario_usage"] = None
+            set_scenario_batch(None)
             st.session_state["simulation_messages"] = []
+            st.session_state["conversation_text"] = ""
+            st.session_state["history_summary"] = ""
+            st.session_state["conversation_tokens"] = 0
+            st.session_state["summarized_upto"] = 0
+            st.session_state["summarized_tokens"] = 0
             st.session_state["evaluation_feedback"] = None
             st.session_state["simulation_finished"] = False
             st.success("All cleared. Scroll up to Step 1 to begin again.")
 
 ###############################################################################
-# 6) RUN
+# 9) RUN
 ###############################################################################
 if __name__ == "__main__":
     main()